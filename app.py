@@ -2,10 +2,16 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import yfinance as yf
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
+import hashlib
 import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
 import squarify
+from rebalance import holdings_matrix, sector_matrix, find_rebalance, rebalance_report
 
 app = Flask(__name__)
 CORS(app)  # Allow cross-origin requests for frontend communication
@@ -13,12 +19,25 @@ CORS(app)  # Allow cross-origin requests for frontend communication
 import requests
 from bs4 import BeautifulSoup
 
+# Point this at a local stub (see loadtest.py) to run without hitting the real site
+HOLDINGS_BASE_URL = os.environ.get("HOLDINGS_BASE_URL", "https://stockanalysis.com")
+
+# Fund holdings are re-fetched after this many seconds; results computed from an older
+# snapshot are dropped as soon as a re-fetch shows the holdings changed
+HOLDINGS_TTL = int(os.environ.get("HOLDINGS_TTL", 3600))
+RESULT_CACHE_SIZE = 256
+TOP_K = 30
+
+holdings_cache = {}  # (kind, ticker) -> (fetched_at, version, holdings)
+result_cache = OrderedDict()  # portfolio fingerprint -> (exposure, exposure_without_prefix)
+cache_lock = threading.Lock()
+
 def convert_us_format(s):
     return float((s.replace("%","")).replace(",", ""))
 
 def get_etf_holdings_from_stock_analysis(ticker):
     """Fetch mutual fund holdings from Morningstar"""
-    url = f"https://stockanalysis.com/etf/{ticker}/holdings/"
+    url = f"{HOLDINGS_BASE_URL}/etf/{ticker}/holdings/"
     print(url)
 
     headers = {
@@ -63,7 +82,7 @@ def get_etf_holdings_from_stock_analysis(ticker):
 
 def get_mutualfunds_holdings_from_stock_analysis(ticker):
     """Fetch mutual fund holdings from Morningstar"""
-    url = f"https://stockanalysis.com/quote/mutf/{ticker}/holdings/"
+    url = f"{HOLDINGS_BASE_URL}/quote/mutf/{ticker}/holdings/"
     print(url)
 
     headers = {
@@ -145,6 +164,69 @@ def round_k_decimal(dictionary,k):
         dictionary[key] = round(value,k)
     return dictionary
 
+def normalize_ticker(ticker):
+    return ticker.strip().upper()
+
+def holdings_version(holdings):
+    """Short hash of a holdings table, changes whenever any weight changes"""
+    return hashlib.sha1(json.dumps(sorted(holdings.items())).encode()).hexdigest()[:12]
+
+def invalidate_results(fund_key):
+    """Drop every cached result that includes the given (kind, ticker) fund"""
+    for fingerprint in list(result_cache):
+        weights = fingerprint[0]
+        if any((kind, ticker) == fund_key for kind, ticker, _ in weights):
+            del result_cache[fingerprint]
+
+def get_holdings_snapshot(kind, ticker):
+    """Return (holdings, version) for a fund, fetching only when the cached copy is stale"""
+    key = (kind, ticker)
+    with cache_lock:
+        cached = holdings_cache.get(key)
+    if cached and time.time() - cached[0] < HOLDINGS_TTL:
+        return cached[2], cached[1]
+
+    if kind == "etf":
+        holdings = get_etf_holdings_from_stock_analysis(ticker)
+    else:
+        holdings = get_mutualfunds_holdings_from_stock_analysis(ticker)
+    if holdings is None:
+        return None, None  # failed fetches are not cached
+
+    version = holdings_version(holdings)
+    with cache_lock:
+        if cached and cached[1] != version:
+            invalidate_results(key)
+        holdings_cache[key] = (time.time(), version, holdings)
+    return holdings, version
+
+def portfolio_fingerprint(etfs, mutualfunds, individual_stocks, versions, top_k):
+    """
+    Canonical key for a portfolio: tickers normalized and sorted, amounts reduced to weights
+    (so scaling every amount gives the same key), plus holdings versions and options
+    """
+    total_portfolio = sum(fund["amount"] for fund in etfs + mutualfunds + individual_stocks)
+    amounts = {}
+    for kind, funds in (("etf", etfs), ("mf", mutualfunds), ("stock", individual_stocks)):
+        for fund in funds:
+            key = (kind, normalize_ticker(fund["ticker"]))
+            amounts[key] = amounts.get(key, 0) + fund["amount"]
+    weights = tuple(sorted(
+        (kind, ticker, round(amount / total_portfolio, 9)) for (kind, ticker), amount in amounts.items()
+    ))
+    return weights, tuple(sorted(versions.items())), top_k
+
+def parse_top_k(data):
+    """Positive integer topK from the request body, or None if it is not one"""
+    top_k = data.get('topK', TOP_K)
+    if isinstance(top_k, bool) or (isinstance(top_k, float) and not top_k.is_integer()):
+        return None
+    try:
+        top_k = int(top_k)
+    except (TypeError, ValueError):
+        return None
+    return top_k if top_k > 0 else None
+
 @app.route('/calculate_exposure', methods=['POST'])
 def calculate_exposure():
     global exposure_without_prefix
@@ -152,6 +234,9 @@ def calculate_exposure():
     etfs = data.get('etfs', [])  # List of {'ticker': 'XYZ', 'amount': 10}
     mutualfunds = data.get('mutualFunds', [])  # List of {'ticker': 'XYZ', 'amount': 10}
     individual_stocks = data.get('individualStocks', [])  # List of {'ticker': 'XYZ', 'amount': 10}
+    top_k = parse_top_k(data)
+    if top_k is None:
+        return jsonify({"error": "topK must be a positive integer"}), 400
 
     print(f"ETFs: {etfs}")
     print(f"Mutual Funds: {mutualfunds}")
@@ -162,30 +247,51 @@ def calculate_exposure():
     total_portfolio = sum(fund["amount"] for fund in funds)
     print(f"Total Portfolio Value: {total_portfolio}")
 
+    # Holdings snapshots come from the holdings cache, their versions go into the fingerprint
+    snapshots = {}
+    for kind, fund_list in (("etf", etfs), ("mf", mutualfunds)):
+        for fund in fund_list:
+            key = (kind, normalize_ticker(fund["ticker"]))
+            if key not in snapshots:
+                snapshots[key] = get_holdings_snapshot(*key)
+    for (kind, ticker), (fund_holdings, _) in snapshots.items():
+        if fund_holdings is None:
+            return jsonify({"error": f"Could not fetch holdings for {ticker}"}), 502
+    versions = {key: version for key, (_, version) in snapshots.items()}
+
+    fingerprint = portfolio_fingerprint(etfs, mutualfunds, individual_stocks, versions, top_k)
+    with cache_lock:
+        cached = result_cache.get(fingerprint)
+        if cached is not None:
+            result_cache.move_to_end(fingerprint)
+    if cached is not None:
+        print("Returning cached exposure")
+        exposure, exposure_without_prefix = cached
+        return jsonify({"exposure": exposure})
+
     holdings = {}
 
     print("Processing ETFs:")
     for fund in etfs:
-        ticker = fund["ticker"]
+        ticker = normalize_ticker(fund["ticker"])
         allocation = fund["amount"] / total_portfolio  # Normalize allocation
         #print(f"Fund: {ticker}, Allocation: {allocation}")
 
-        etf_holdings = get_etf_holdings_from_stock_analysis(ticker)
-        for stock in etf_holdings:
-            etf_holdings[stock] = allocation * etf_holdings[stock]
-        
+        etf_holdings, _ = snapshots[("etf", ticker)]
+        # Scale into a new dict, the snapshot is shared through the holdings cache
+        etf_holdings = {stock: allocation * percent for stock, percent in etf_holdings.items()}
+
         holdings = update_dict(holdings, etf_holdings)
         print_top_k(holdings,10)
 
     print("Processing Mutual Funds:")
     for fund in mutualfunds:
-        ticker = fund["ticker"]
+        ticker = normalize_ticker(fund["ticker"])
         allocation = fund["amount"] / total_portfolio  # Normalize allocation
         #print(f"Fund: {ticker}, Allocation: {allocation}")
 
-        mf_holdings = get_mutualfunds_holdings_from_stock_analysis(ticker)
-        for stock in mf_holdings:
-            mf_holdings[stock] = allocation * mf_holdings[stock] 
+        mf_holdings, _ = snapshots[("mf", ticker)]
+        mf_holdings = {stock: allocation * percent for stock, percent in mf_holdings.items()}
 
         holdings = update_dict(holdings, mf_holdings)
         print_top_k(holdings,10)
@@ -193,27 +299,94 @@ def calculate_exposure():
     print("Processing Individual Stocks:")
     stocks_dict = {}
     for stock in individual_stocks:
-        ticker = stock["ticker"]
+        ticker = normalize_ticker(stock["ticker"])
         # Need to multipy by 100 because the ETF and MF report percentages
         allocation = 100*stock["amount"] / total_portfolio
-        stocks_dict[ticker] = allocation
+        stocks_dict[ticker] = stocks_dict.get(ticker, 0) + allocation
 
     holdings = update_dict(holdings, stocks_dict)
-    exposure_without_prefix = return_top_k(holdings, 30)
+    exposure_without_prefix = return_top_k(holdings, top_k)
     exposure = add_prefix(exposure_without_prefix)
     exposure = add_other(exposure)
     exposure = round_k_decimal(exposure,3)
     exposure_without_prefix = add_other(exposure_without_prefix)
     print(exposure)
 
+    with cache_lock:
+        result_cache[fingerprint] = (exposure, exposure_without_prefix)
+        if len(result_cache) > RESULT_CACHE_SIZE:
+            result_cache.popitem(last=False)
+
     return jsonify({"exposure": exposure})
 
+@app.route('/rebalance', methods=['POST'])
+def rebalance():
+    """
+    Closest reallocation among the funds already held so that no stock exceeds securityCap %
+    (default 5) and, if a {stock: sector} map is sent as 'sectors', no sector exceeds sectorCap %
+    """
+    data = request.json
+    etfs = data.get('etfs', [])
+    mutualfunds = data.get('mutualFunds', [])
+    individual_stocks = data.get('individualStocks', [])
+    security_cap = float(data.get('securityCap', 5))
+    sector_cap = data.get('sectorCap')
+    sectors = data.get('sectors', {})
+    top_k = parse_top_k(data)
+    if top_k is None:
+        return jsonify({"error": "topK must be a positive integer"}), 400
+
+    # One column per position: a fund's holdings, or 100% in an individual stock
+    positions = []
+    fund_holdings = []
+    amounts = []
+    for kind, fund_list in (("etf", etfs), ("mf", mutualfunds), ("stock", individual_stocks)):
+        for fund in fund_list:
+            ticker = normalize_ticker(fund["ticker"])
+            if kind == "stock":
+                holdings = {ticker: 100.0}
+            else:
+                holdings, _ = get_holdings_snapshot(kind, ticker)
+                if holdings is None:
+                    return jsonify({"error": f"Could not fetch holdings for {ticker}"}), 502
+            positions.append((kind, ticker))
+            fund_holdings.append(holdings)
+            amounts.append(fund["amount"])
+
+    if not positions:
+        return jsonify({"error": "Portfolio is empty"}), 400
+
+    total_portfolio = sum(amounts)
+    stocks, H = holdings_matrix(fund_holdings)
+    S = None
+    if sector_cap is not None:
+        _, S = sector_matrix(stocks, {normalize_ticker(k): v for k, v in sectors.items()})
+        sector_cap = float(sector_cap)
+
+    weights = find_rebalance(H, np.array(amounts) / total_portfolio, security_cap, S, sector_cap)
+    if weights is None:
+        return jsonify({"error": "No allocation of the current funds meets the caps"}), 422
+
+    allocation = [
+        {"type": kind, "ticker": ticker, "weight": round(float(w), 4),
+         "amount": round(float(w) * total_portfolio, 2), "change": round(float(w) * total_portfolio - amount, 2)}
+        for (kind, ticker), w, amount in zip(positions, weights, amounts)
+    ]
+    turnover = float(np.abs(weights - np.array(amounts) / total_portfolio).sum() / 2)
+
+    return jsonify({
+        "allocation": allocation,
+        "turnover": round(turnover, 4),
+        "exposure": rebalance_report(stocks, H, weights, top_k),
+    })
+
 @app.route('/get_pie_chart')
 def get_pie_chart():
     global exposure_without_prefix
+    import matplotlib.pyplot as plt
     # Create Pie Chart
-    labels = list(exposure.keys())
-    sizes = list(exposure.values())
+    labels = list(exposure_without_prefix.keys())
+    sizes = list(exposure_without_prefix.values())
 
     plt.figure(figsize=(6, 6))
     plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=140)
@@ -231,6 +404,7 @@ def get_pie_chart():
 @app.route('/get_treemap')
 def get_treemap():
     global exposure_without_prefix
+    import matplotlib.pyplot as plt
 
     labels = list(exposure_without_prefix.keys())
     sizes = list(exposure_without_prefix.values())
@@ -248,6 +422,44 @@ def get_treemap():
     print('Returning tree map')
     return send_file(img_io, mimetype='image/png')
 
+def treemap_layout(dictionary, width=100, height=100):
+    """Treemap rectangles in a width x height box, same order as squarify.plot"""
+    items = [(key, value) for key, value in dictionary.items() if value > 0]
+    if not items:
+        return []
+    sizes = squarify.normalize_sizes([value for _, value in items], width, height)
+    rects = squarify.squarify(sizes, 0, 0, width, height)
+    return [
+        {"label": key, "value": round(value, 3),
+         "x": round(rect["x"], 3), "y": round(rect["y"], 3),
+         "dx": round(rect["dx"], 3), "dy": round(rect["dy"], 3)}
+        for (key, value), rect in zip(items, rects)
+    ]
+
+def pie_layout(dictionary, startangle=140):
+    """Pie slices as start/end angles in degrees, counterclockwise like plt.pie"""
+    items = [(key, value) for key, value in dictionary.items() if value > 0]
+    total = sum(value for _, value in items)
+    slices = []
+    angle = startangle
+    for key, value in items:
+        sweep = 360 * value / total
+        slices.append({"label": key, "value": round(value, 3),
+                       "percent": round(100 * value / total, 1),
+                       "start": round(angle, 3), "end": round(angle + sweep, 3)})
+        angle += sweep
+    return slices
+
+@app.route('/get_chart_layout')
+def get_chart_layout():
+    """Treemap and pie geometry as JSON so the browser can draw the charts itself"""
+    global exposure_without_prefix
+
+    return jsonify({
+        "treemap": treemap_layout(exposure_without_prefix),
+        "pie": pie_layout(exposure_without_prefix),
+    })
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
 
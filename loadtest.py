@@ -0,0 +1,233 @@
+"""
+Load-test harness for the Flask app in app.py.
+
+Starts a local stub of the holdings site (configurable latency and error rate),
+starts app.py under gunicorn pointed at the stub, replays random portfolio mixes
+against /calculate_exposure and the chart endpoints, and reports
+throughput, p50/p95/p99 latency and error rate for every workers x threads setting.
+
+Usage:
+    pip install gunicorn
+    python loadtest.py --workers 1 2 4 --threads 1 4 --concurrency 16 --duration 30 \
+        --stub-latency 0.2 --stub-error-rate 0.02
+
+By default the app's holdings cache is disabled (--holdings-ttl 0) so every request
+exercises the scraping path; pass e.g. --holdings-ttl 3600 to measure the cached path.
+"""
+import argparse
+import hashlib
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+ENDPOINTS = ["/calculate_exposure", "/get_treemap", "/get_pie_chart", "/get_chart_layout"]
+
+# Tickers users typically enter, so the stub serves overlapping holdings
+ETF_TICKERS = ["VOO", "SPY", "QQQ", "VTI", "SCHD", "VUG", "IWM", "VGT", "XLK", "VXUS"]
+MUTUAL_FUND_TICKERS = ["FXAIX", "VFIAX", "VTSAX", "SWPPX", "FCNTX", "AGTHX", "VIGAX"]
+STOCK_TICKERS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "BRK.B", "JPM", "V"]
+STOCK_UNIVERSE = STOCK_TICKERS + [f"STK{i:03d}" for i in range(400)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def stub_holdings(ticker, num_holdings=100):
+    """Deterministic fake holdings for a fund: same ticker -> same table"""
+    seed = int(hashlib.md5(ticker.encode()).hexdigest(), 16) % (2**32)
+    rng = random.Random(seed)
+    symbols = rng.sample(STOCK_UNIVERSE, num_holdings)
+    weights = sorted((rng.paretovariate(1.2) for _ in symbols), reverse=True)
+    total = sum(weights)
+    return [(symbol, 100 * weight / total) for symbol, weight in zip(symbols, weights)]
+
+
+def render_holdings_page(ticker):
+    rows = "".join(
+        f"<tr><td>{i}</td><td>{symbol}</td><td>{symbol} Inc.</td><td>{percent:,.2f}%</td><td>1,000</td></tr>"
+        for i, (symbol, percent) in enumerate(stub_holdings(ticker), 1)
+    )
+    return (
+        "<html><body><table><thead><tr><th>No.</th><th>Symbol</th><th>Name</th>"
+        f"<th>% Weight</th><th>Shares</th></tr></thead><tbody>{rows}</tbody></table></body></html>"
+    )
+
+
+def make_stub_handler(latency, jitter, error_rate):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # Paths look like /etf/<ticker>/holdings/ or /quote/mutf/<ticker>/holdings/
+            parts = [p for p in self.path.split("/") if p]
+            time.sleep(max(0.0, random.gauss(latency, jitter)))
+            if len(parts) < 3 or parts[-1] != "holdings":
+                self.send_error(404)
+                return
+            if random.random() < error_rate:
+                self.send_error(503)
+                return
+            body = render_holdings_page(parts[-2]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub(port, latency, jitter, error_rate):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_stub_handler(latency, jitter, error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(port, stub_url, workers, threads, holdings_ttl):
+    # HOLDINGS_TTL=0 makes every request re-fetch from the stub, so stub latency and errors are measured
+    env = dict(os.environ, HOLDINGS_BASE_URL=stub_url, HOLDINGS_TTL=str(holdings_ttl), MPLBACKEND="Agg")
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers),
+        "--threads", str(threads),
+        "--timeout", "120",
+        "--log-level", "warning",
+    ]
+    proc = subprocess.Popen(
+        cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    # Wait until gunicorn accepts connections
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup (is it installed?)")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("app did not start within 30s")
+
+
+def random_portfolio(rng):
+    """A mix resembling what users enter in index.html: a few ETFs, maybe funds and stocks"""
+    def pick(tickers, lo, hi):
+        return [
+            {"ticker": t, "amount": round(rng.lognormvariate(9, 1), 2)}
+            for t in rng.sample(tickers, rng.randint(lo, hi))
+        ]
+
+    return {
+        "etfs": pick(ETF_TICKERS, 1, 4),
+        "mutualFunds": pick(MUTUAL_FUND_TICKERS, 0, 2),
+        "individualStocks": pick(STOCK_TICKERS, 0, 3),
+    }
+
+
+def user_session(base_url, stop_at, seed, results, lock):
+    """One virtual user: submit a portfolio, then fetch the charts, until time runs out"""
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.time() < stop_at:
+        for endpoint in ENDPOINTS:
+            start = time.perf_counter()
+            try:
+                if endpoint == "/calculate_exposure":
+                    response = session.post(base_url + endpoint, json=random_portfolio(rng), timeout=120)
+                else:
+                    response = session.get(base_url + endpoint, timeout=120)
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                results[endpoint].append((elapsed, ok))
+
+
+def run_load(base_url, concurrency, duration, seed):
+    results = {endpoint: [] for endpoint in ENDPOINTS}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    stop_at = time.time() + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(concurrency):
+            pool.submit(user_session, base_url, stop_at, seed + i, results, lock)
+    # Users finish their in-flight loop after stop_at, so measure the real wall time
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def summarize(results, elapsed):
+    rows = []
+    for endpoint, samples in results.items():
+        if not samples:
+            rows.append((endpoint, 0, 0.0, np.nan, np.nan, np.nan, np.nan))
+            continue
+        latencies = np.array([s[0] for s in samples]) * 1000
+        errors = sum(1 for s in samples if not s[1])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        rows.append((endpoint, len(samples), len(samples) / elapsed, p50, p95, p99, 100 * errors / len(samples)))
+    return rows
+
+
+def print_report(workers, threads, rows):
+    print(f"\nworkers={workers} threads={threads}")
+    print(f"{'endpoint':<22}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors %':>10}")
+    for endpoint, count, rps, p50, p95, p99, err in rows:
+        print(f"{endpoint:<22}{count:>10}{rps:>10.2f}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{err:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test app.py against a local holdings stub")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="gunicorn worker counts to try")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="gunicorn threads per worker to try")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of simultaneous virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per setting")
+    parser.add_argument("--stub-latency", type=float, default=0.15, help="mean stub response time in seconds")
+    parser.add_argument("--stub-jitter", type=float, default=0.05, help="stddev of stub response time in seconds")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="fraction of stub requests answered with 503")
+    parser.add_argument("--holdings-ttl", type=int, default=0,
+                        help="seconds the app keeps fund holdings; 0 re-fetches from the stub on every request")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the portfolio mixes")
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = start_stub(stub_port, args.stub_latency, args.stub_jitter, args.stub_error_rate)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    print(f"Holdings stub on {stub_url} (latency {args.stub_latency}s, error rate {args.stub_error_rate}, "
+          f"app holdings TTL {args.holdings_ttl}s)")
+
+    try:
+        for workers in args.workers:
+            for threads in args.threads:
+                app_port = free_port()
+                proc = start_app(app_port, stub_url, workers, threads, args.holdings_ttl)
+                try:
+                    results, elapsed = run_load(f"http://127.0.0.1:{app_port}", args.concurrency, args.duration, args.seed)
+                finally:
+                    proc.terminate()
+                    proc.wait()
+                print_report(workers, threads, summarize(results, elapsed))
+    finally:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
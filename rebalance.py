@@ -0,0 +1,162 @@
+"""
+What-if rebalancing among the funds a portfolio already holds.
+
+Look-through exposure is linear in the fund weights: exposure = H @ w, where
+H[i, j] is the % of fund j invested in stock i. Caps on single stocks and on
+sectors are therefore linear constraints, and the allowed allocations form a
+convex region of the weight simplex. Only caps some fund exceeds on its own
+can bind, so after dropping the rest the problem is a small linear program
+(minimize turnover subject to the caps), solved exactly with a dense numpy
+simplex. No scipy needed.
+"""
+import numpy as np
+
+TOLERANCE = 1e-9
+
+
+def holdings_matrix(fund_holdings):
+    """
+    fund_holdings: list of {stock: percent} dicts, one per fund (an individual
+    stock is {ticker: 100}). Returns (stocks, H) with H of shape (n_stocks, n_funds).
+    """
+    stocks = sorted({stock for holdings in fund_holdings for stock in holdings})
+    row = {stock: i for i, stock in enumerate(stocks)}
+    H = np.zeros((len(stocks), len(fund_holdings)))
+    for j, holdings in enumerate(fund_holdings):
+        for stock, percent in holdings.items():
+            H[row[stock], j] += percent
+    return stocks, H
+
+
+def sector_matrix(stocks, sectors):
+    """One-hot (n_sectors, n_stocks) matrix from a {stock: sector} mapping; unmapped stocks are ignored"""
+    names = sorted({sectors[stock] for stock in stocks if stock in sectors})
+    col = {name: i for i, name in enumerate(names)}
+    S = np.zeros((len(names), len(stocks)))
+    for i, stock in enumerate(stocks):
+        if stock in sectors:
+            S[col[sectors[stock]], i] = 1.0
+    return names, S
+
+
+def constraint_matrix(H, security_cap, S=None, sector_cap=None):
+    """Stack the constraints as A @ w <= b"""
+    A, b = [H], [np.full(H.shape[0], security_cap)]
+    if S is not None and sector_cap is not None and len(S):
+        A.append(S @ H)
+        b.append(np.full(S.shape[0], sector_cap))
+    return np.vstack(A), np.concatenate(b)
+
+
+def _pivot(T, basis, row, col):
+    T[row] /= T[row, col]
+    others = np.arange(len(T)) != row
+    T[others] -= np.outer(T[others, col], T[row])
+    basis[row] = col
+
+
+def _run_simplex(T, basis, n_cols, max_iter):
+    """Pivot until no reduced cost in the first n_cols columns is negative (Bland's rule, so no cycling)"""
+    for _ in range(max_iter):
+        entering = np.flatnonzero(T[-1, :n_cols] < -TOLERANCE)
+        if not len(entering):
+            return True
+        col = entering[0]
+        column = T[:-1, col]
+        rows = np.flatnonzero(column > TOLERANCE)
+        if not len(rows):
+            return False  # unbounded; cannot happen on the simplex
+        ratios = T[rows, -1] / column[rows]
+        ties = rows[ratios <= ratios.min() + TOLERANCE]
+        _pivot(T, basis, ties[np.argmin([basis[i] for i in ties])], col)
+    return False
+
+
+def linprog(c, A_eq, b_eq, max_iter=10000):
+    """
+    min c @ x subject to A_eq @ x = b_eq, x >= 0 (with b_eq >= 0), by the
+    two-phase tableau simplex method. Returns x, or None if infeasible.
+    """
+    m, n = A_eq.shape
+    # Phase 1: one artificial variable per row, minimize their sum
+    T = np.zeros((m + 1, n + m + 1))
+    T[:m, :n] = A_eq
+    T[:m, n:n + m] = np.eye(m)
+    T[:m, -1] = b_eq
+    T[-1, :n] = -A_eq.sum(axis=0)
+    T[-1, -1] = -b_eq.sum()
+    basis = list(range(n, n + m))
+    if not _run_simplex(T, basis, n + m, max_iter):
+        return None
+    if -T[-1, -1] > 1e-7 * max(1.0, b_eq.sum()):
+        return None
+
+    # Pivot artificials that stayed basic (at zero) out; rows where that is impossible are redundant
+    keep = []
+    for i in range(m):
+        if basis[i] >= n:
+            candidates = np.flatnonzero(np.abs(T[i, :n]) > TOLERANCE)
+            if not len(candidates):
+                continue
+            _pivot(T, basis, i, candidates[0])
+        keep.append(i)
+    T = np.vstack([T[keep][:, list(range(n)) + [-1]], np.zeros(n + 1)])
+    basis = [basis[i] for i in keep]
+
+    # Phase 2: the real objective, expressed in reduced costs of the current basis
+    T[-1, :n] = c
+    for i, j in enumerate(basis):
+        T[-1] -= c[j] * T[i]
+    if not _run_simplex(T, basis, n, max_iter):
+        return None
+
+    x = np.zeros(n)
+    for i, j in enumerate(basis):
+        x[j] = T[i, -1]
+    return x
+
+
+def find_rebalance(H, current_weights, security_cap, S=None, sector_cap=None):
+    """
+    Closest allocation (in turnover) to current_weights such that no stock exceeds
+    security_cap % and no sector exceeds sector_cap % of look-through exposure.
+    Returns the new weights (summing to 1), or None if no allocation of these
+    funds meets the caps.
+    """
+    w0 = np.asarray(current_weights, dtype=float)
+    w0 = w0 / w0.sum()
+    A, b = constraint_matrix(H, security_cap, S, sector_cap)
+    # Loads are convex combinations of a row's entries, so a row can only bind if some
+    # fund alone exceeds the cap; large funds have thousands of holdings that never do
+    binding = A.max(axis=1) > b + TOLERANCE
+    A, b = A[binding], b[binding]
+    if (A @ w0 <= b + TOLERANCE).all():
+        return w0
+
+    # Turnover is sum(|w - w0|) / 2 = sum(d) with d >= w0 - w, d >= 0, since both sum to 1.
+    # Variables x = [w, d, s, t] with slacks s (caps) and t (d + w - t = w0):
+    #   A @ w + s = b,   d + w - t = w0,   sum(w) = 1,   all >= 0
+    n, m = len(w0), len(b)
+    eye = np.eye(n)
+    A_eq = np.zeros((m + n + 1, 3 * n + m))
+    A_eq[:m, :n] = A
+    A_eq[:m, 2 * n:2 * n + m] = np.eye(m)
+    A_eq[m:m + n, :n] = eye
+    A_eq[m:m + n, n:2 * n] = eye
+    A_eq[m:m + n, 2 * n + m:] = -eye
+    A_eq[-1, :n] = 1
+    b_eq = np.concatenate([b, w0, [1.0]])
+    c = np.concatenate([np.zeros(n), np.ones(n), np.zeros(n + m)])
+
+    x = linprog(c, A_eq, b_eq)
+    if x is None:
+        return None
+    weights = np.clip(x[:n], 0, None)
+    return weights / weights.sum()
+
+
+def rebalance_report(stocks, H, weights, top_k=30):
+    """Top look-through exposures (%) for the given weights"""
+    exposure = H @ weights
+    order = np.argsort(-exposure)[:top_k]
+    return {stocks[i]: round(float(exposure[i]), 3) for i in order}
@@ -6,6 +6,8 @@ import requests
 from bs4 import BeautifulSoup
 import io
 import squarify
+import hashlib
+import json
 
 st.set_page_config(page_title="Portfolio X-ray", layout="wide")
 
@@ -83,32 +85,86 @@ def add_other(dictionary):
     dictionary["Others"] = max(0.01, 100 - total_percentage)
     return dictionary
 
-def calculate_exposure(etfs, mutualfunds, stocks):
-    exposure = {}
-    total_portfolio = sum(fund["amount"] for fund in etfs + mutualfunds + stocks)
-
-    for fund in etfs:
-        ticker = fund["ticker"]
-        allocation = fund["amount"] / total_portfolio
-        etf_holdings = get_etf_holdings_from_stock_analysis(ticker) or {}
-        exposure = update_dict(exposure, {k: v * allocation for k, v in etf_holdings.items()})
+# Fund holdings are re-fetched after this many seconds. A change shows up as a new
+# holdings version, which changes the portfolio fingerprint, so stale results are never served.
+HOLDINGS_TTL = 3600
+TOP_K = 40
+
+def normalize_ticker(ticker):
+    return str(ticker).strip().upper()
+
+def holdings_version(holdings):
+    return hashlib.sha1(json.dumps(sorted(holdings.items())).encode()).hexdigest()[:12]
+
+@st.cache_data(ttl=HOLDINGS_TTL, show_spinner=False)
+def get_holdings_snapshot(fund_type, ticker):
+    """Holdings of an ETF or MF plus a version hash; raises on failure so failures are not cached"""
+    if fund_type == "ETF":
+        holdings = get_etf_holdings_from_stock_analysis(ticker)
+    else:
+        holdings = get_mutualfunds_holdings_from_stock_analysis(ticker)
+    if holdings is None:
+        raise ValueError(f"Could not fetch holdings for {ticker}")
+    return holdings, holdings_version(holdings)
+
+def holdings_snapshot_or_empty(fund_type, ticker):
+    try:
+        return get_holdings_snapshot(fund_type, ticker)
+    except ValueError:
+        return {}, None
 
-    for fund in mutualfunds:
-        ticker = fund["ticker"]
-        allocation = fund["amount"] / total_portfolio
-        mf_holdings = get_mutualfunds_holdings_from_stock_analysis(ticker) or {}
-        exposure = update_dict(exposure, {k: v * allocation for k, v in mf_holdings.items()})
+def portfolio_weights(etfs, mutualfunds, stocks):
+    """Tickers normalized and sorted, amounts reduced to weights (so scaling every amount gives the same key)"""
+    total_portfolio = sum(fund["amount"] for fund in etfs + mutualfunds + stocks)
+    amounts = {}
+    for fund_type, funds in (("ETF", etfs), ("MF", mutualfunds), ("IS", stocks)):
+        for fund in funds:
+            key = (fund_type, normalize_ticker(fund["ticker"]))
+            amounts[key] = amounts.get(key, 0) + fund["amount"]
+    return tuple(sorted(
+        (fund_type, ticker, round(amount / total_portfolio, 9)) for (fund_type, ticker), amount in amounts.items()
+    ))
+
+def portfolio_fingerprint(weights, snapshots, top_k=TOP_K):
+    """Canonical key for a portfolio: its weights plus the versions of the snapshots used and top-k"""
+    versions = tuple(sorted((fund_type, ticker, version) for (fund_type, ticker), (_, version) in snapshots.items()))
+    return weights, versions, top_k
+
+def compute_exposure(weights, snapshots, top_k):
+    exposure = {}
 
-    for stock in stocks:
-        ticker = stock["ticker"]
-        allocation = 100 * stock["amount"] / total_portfolio
-        exposure[ticker] = exposure.get(ticker, 0) + allocation
+    for fund_type, ticker, weight in weights:
+        if fund_type == "IS":
+            exposure[ticker] = exposure.get(ticker, 0) + 100 * weight
+        else:
+            holdings, _ = snapshots[(fund_type, ticker)]
+            exposure = update_dict(exposure, {k: v * weight for k, v in holdings.items()})
 
-    exposure = return_top_k(exposure, 40)
+    exposure = return_top_k(exposure, top_k)
     exposure = add_other(exposure)
 
     return exposure
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def exposure_for_fingerprint(fingerprint, _snapshots):
+    # _snapshots is not hashed by streamlit; its versions are already part of the fingerprint
+    weights, _, top_k = fingerprint
+    return compute_exposure(weights, _snapshots, top_k)
+
+def calculate_exposure(etfs, mutualfunds, stocks, top_k=TOP_K):
+    weights = portfolio_weights(etfs, mutualfunds, stocks)
+    # Fetch each fund once; the same snapshots build the key and the result
+    snapshots = {
+        (fund_type, ticker): holdings_snapshot_or_empty(fund_type, ticker)
+        for fund_type, ticker, _ in weights if fund_type != "IS"
+    }
+    if any(version is None for _, version in snapshots.values()):
+        # A fund could not be fetched: show what we have, but don't cache it
+        return compute_exposure(weights, snapshots, top_k)
+
+    # Identical or proportionally scaled portfolios hit the cache
+    return exposure_for_fingerprint(portfolio_fingerprint(weights, snapshots, top_k), snapshots)
+
 def plot_treemap(exposure):
     labels = list(exposure.keys())
     sizes = list(exposure.values())
@@ -7,6 +7,9 @@ import requests
 from bs4 import BeautifulSoup
 import io
 import squarify
+import hashlib
+import json
+from rebalance import holdings_matrix, find_rebalance, rebalance_report
 
 st.set_page_config(page_title="Portfolio X-ray", layout="wide")
 
@@ -109,32 +112,137 @@ def add_other(dictionary):
     dictionary["Others"] = max(0, 100 - total_percentage)
     return dictionary
 
-def calculate_exposure(etfs, mutualfunds, stocks):
-    exposure = {}
+# Fund holdings are re-fetched after this many seconds. A change shows up as a new
+# holdings version, which changes the portfolio fingerprint, so stale results are never served.
+HOLDINGS_TTL = 3600
+TOP_K = 30
+
+def normalize_ticker(ticker):
+    return str(ticker).strip().upper()
+
+def holdings_version(holdings):
+    return hashlib.sha1(json.dumps(sorted(holdings.items())).encode()).hexdigest()[:12]
+
+@st.cache_data(ttl=HOLDINGS_TTL, show_spinner=False)
+def get_holdings_snapshot(fund_type, ticker):
+    """Holdings of an ETF or MF plus a version hash; raises on failure so failures are not cached"""
+    if fund_type == "ETF":
+        holdings = get_etf_holdings_from_stock_analysis(ticker)
+    else:
+        holdings = get_mutualfunds_holdings_from_stock_analysis(ticker)
+    if holdings is None:
+        raise ValueError(f"Could not fetch holdings for {ticker}")
+    return holdings, holdings_version(holdings)
+
+def holdings_snapshot_or_empty(fund_type, ticker):
+    try:
+        return get_holdings_snapshot(fund_type, ticker)
+    except ValueError:
+        return {}, None
+
+def portfolio_weights(etfs, mutualfunds, stocks):
+    """Tickers normalized and sorted, amounts reduced to weights (so scaling every amount gives the same key)"""
     total_portfolio = sum(fund["amount"] for fund in etfs + mutualfunds + stocks)
+    amounts = {}
+    for fund_type, funds in (("ETF", etfs), ("MF", mutualfunds), ("IS", stocks)):
+        for fund in funds:
+            key = (fund_type, normalize_ticker(fund["ticker"]))
+            amounts[key] = amounts.get(key, 0) + fund["amount"]
+    return tuple(sorted(
+        (fund_type, ticker, round(amount / total_portfolio, 9)) for (fund_type, ticker), amount in amounts.items()
+    ))
 
-    for fund in etfs:
-        ticker = fund["ticker"]
-        allocation = fund["amount"] / total_portfolio
-        etf_holdings = get_etf_holdings_from_stock_analysis(ticker) or {}
-        exposure = update_dict(exposure, {k: v * allocation for k, v in etf_holdings.items()})
+def portfolio_fingerprint(weights, snapshots, top_k=TOP_K):
+    """Canonical key for a portfolio: its weights plus the versions of the snapshots used and top-k"""
+    versions = tuple(sorted((fund_type, ticker, version) for (fund_type, ticker), (_, version) in snapshots.items()))
+    return weights, versions, top_k
 
-    for fund in mutualfunds:
-        ticker = fund["ticker"]
-        allocation = fund["amount"] / total_portfolio
-        mf_holdings = get_mutualfunds_holdings_from_stock_analysis(ticker) or {}
-        exposure = update_dict(exposure, {k: v * allocation for k, v in mf_holdings.items()})
+def compute_exposure(weights, snapshots, top_k):
+    exposure = {}
 
-    for stock in stocks:
-        ticker = stock["ticker"]
-        allocation = 100 * stock["amount"] / total_portfolio
-        exposure[ticker] = exposure.get(ticker, 0) + allocation
+    for fund_type, ticker, weight in weights:
+        if fund_type == "IS":
+            exposure[ticker] = exposure.get(ticker, 0) + 100 * weight
+        else:
+            holdings, _ = snapshots[(fund_type, ticker)]
+            exposure = update_dict(exposure, {k: v * weight for k, v in holdings.items()})
 
-    exposure = return_top_k(exposure, 30)
+    exposure = return_top_k(exposure, top_k)
     exposure = add_other(exposure)
 
     return exposure
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def exposure_for_fingerprint(fingerprint, _snapshots):
+    # _snapshots is not hashed by streamlit; its versions are already part of the fingerprint
+    weights, _, top_k = fingerprint
+    return compute_exposure(weights, _snapshots, top_k)
+
+def calculate_exposure(etfs, mutualfunds, stocks, top_k=TOP_K):
+    weights = portfolio_weights(etfs, mutualfunds, stocks)
+    # Fetch each fund once; the same snapshots build the key and the result
+    snapshots = {
+        (fund_type, ticker): holdings_snapshot_or_empty(fund_type, ticker)
+        for fund_type, ticker, _ in weights if fund_type != "IS"
+    }
+    if any(version is None for _, version in snapshots.values()):
+        # A fund could not be fetched: show what we have, but don't cache it
+        return compute_exposure(weights, snapshots, top_k)
+
+    # Identical or proportionally scaled portfolios hit the cache
+    return exposure_for_fingerprint(portfolio_fingerprint(weights, snapshots, top_k), snapshots)
+
+def rebalance_portfolio(etfs, mutualfunds, stocks, security_cap):
+    """Closest reallocation among the held funds so that no stock exceeds security_cap %"""
+    positions = []
+    fund_holdings = []
+    amounts = []
+    for fund_type, funds in (("ETF", etfs), ("MF", mutualfunds), ("IS", stocks)):
+        for fund in funds:
+            ticker = normalize_ticker(fund["ticker"])
+            if fund_type == "IS":
+                holdings = {ticker: 100.0}
+            else:
+                # Raises ValueError if the fetch fails; an empty column would look like a
+                # fund with no exposure at all and attract the whole rebalance
+                holdings, _ = get_holdings_snapshot(fund_type, ticker)
+            positions.append((fund_type, ticker))
+            fund_holdings.append(holdings)
+            amounts.append(fund["amount"])
+
+    stocks_list, H = holdings_matrix(fund_holdings)
+    amounts = np.array(amounts)
+    weights = find_rebalance(H, amounts / amounts.sum(), security_cap)
+    if weights is None:
+        return None, None
+
+    allocation_df = pd.DataFrame({
+        "Type": [fund_type for fund_type, _ in positions],
+        "Ticker": [ticker for _, ticker in positions],
+        "Current ($)": amounts.round(2),
+        "Suggested ($)": (weights * amounts.sum()).round(2),
+    })
+    allocation_df["Change ($)"] = allocation_df["Suggested ($)"] - allocation_df["Current ($)"]
+    return allocation_df, rebalance_report(stocks_list, H, weights)
+
+def show_rebalance(etfs, mutualfunds, stocks, security_cap):
+    st.subheader(f"Rebalance to keep every stock under {security_cap:g}%:")
+    try:
+        allocation_df, exposure = rebalance_portfolio(etfs, mutualfunds, stocks, security_cap)
+    except ValueError as e:
+        st.warning(f"{e}, so no rebalance can be suggested.")
+        return
+    if allocation_df is None:
+        st.warning("No reallocation of your current funds keeps every stock under this limit.")
+        return
+    col_alloc, col_exposure = st.columns([1.5, 1])
+    with col_alloc:
+        st.dataframe(allocation_df)
+    with col_exposure:
+        exposure_df = pd.DataFrame(exposure.items(), columns=["Stock", "Exposure after rebalance (%)"])
+        exposure_df.index = exposure_df.index + 1
+        st.dataframe(exposure_df)
+
 def plot_treemap(exposure):
     labels = list(exposure.keys())
     sizes = list(exposure.values())
@@ -205,6 +313,12 @@ def main():
     
     # Add a small checkbox for Excel upload option
     use_excel = st.checkbox("Use Excel file instead?")
+
+    # Optional what-if: reallocate among the funds already held to cap single-stock exposure
+    suggest_rebalance = st.checkbox("Suggest a rebalance for a concentration limit?")
+    security_cap = 5.0
+    if suggest_rebalance:
+        security_cap = st.number_input("Max exposure per stock (%)", min_value=0.1, max_value=100.0, value=5.0, step=0.5)
     
     if use_excel:
         uploaded_file = st.file_uploader("Upload your portfolio Excel file", type=['xlsx', 'xls'])
@@ -231,6 +345,9 @@ def main():
                         st.subheader("X-ray Tree map:")
                         treemap_img = plot_treemap(exposure)
                         st.image(treemap_img)
+
+                    if suggest_rebalance:
+                        show_rebalance(etfs, mutualfunds, stocks, security_cap)
             
             except Exception as e:
                 st.error(f"Error processing file: {str(e)}")
@@ -293,6 +410,9 @@ def main():
                     treemap_img = plot_treemap(exposure)
                     st.image(treemap_img)
 
+                if suggest_rebalance:
+                    show_rebalance(etfs, mutualfunds, stocks, security_cap)
+
 if __name__ == "__main__":
     main()
     
\ No newline at end of file
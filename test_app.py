@@ -0,0 +1,76 @@
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    app.holdings_cache.clear()
+    app.result_cache.clear()
+    yield
+    app.holdings_cache.clear()
+    app.result_cache.clear()
+
+
+VERSIONS = {("etf", "VOO"): "v1", ("mf", "FXAIX"): "v2"}
+
+
+def fingerprint(etfs, mutualfunds=(), stocks=(), versions=VERSIONS, top_k=30):
+    return app.portfolio_fingerprint(list(etfs), list(mutualfunds), list(stocks), versions, top_k)
+
+
+def test_fingerprint_ignores_scale_case_and_order():
+    base = fingerprint([{"ticker": "VOO", "amount": 100}], [{"ticker": "FXAIX", "amount": 300}],
+                       [{"ticker": "AAPL", "amount": 100}])
+    scaled = fingerprint([{"ticker": " voo", "amount": 1}], [{"ticker": "fxaix ", "amount": 3}],
+                         [{"ticker": "aapl", "amount": 1}])
+    assert base == scaled
+
+
+def test_fingerprint_sums_duplicate_tickers():
+    split = fingerprint([{"ticker": "VOO", "amount": 50}, {"ticker": "voo", "amount": 50}],
+                        stocks=[{"ticker": "AAPL", "amount": 100}])
+    merged = fingerprint([{"ticker": "VOO", "amount": 100}], stocks=[{"ticker": "AAPL", "amount": 100}])
+    assert split == merged
+
+
+def test_fingerprint_changes_with_weights_versions_and_top_k():
+    etfs = [{"ticker": "VOO", "amount": 100}]
+    stocks = [{"ticker": "AAPL", "amount": 100}]
+    base = fingerprint(etfs, stocks=stocks)
+    assert fingerprint(etfs, stocks=[{"ticker": "AAPL", "amount": 200}]) != base
+    assert fingerprint(etfs, stocks=stocks, versions={("etf", "VOO"): "v9"}) != base
+    assert fingerprint(etfs, stocks=stocks, top_k=10) != base
+
+
+def test_holdings_version():
+    assert app.holdings_version({"AAPL": 7.0, "MSFT": 6.0}) == app.holdings_version({"MSFT": 6.0, "AAPL": 7.0})
+    assert app.holdings_version({"AAPL": 7.0, "MSFT": 6.0}) != app.holdings_version({"AAPL": 7.1, "MSFT": 6.0})
+
+
+def test_invalidate_results_drops_only_entries_with_that_fund():
+    with_voo = fingerprint([{"ticker": "VOO", "amount": 1}])
+    without_voo = fingerprint([], [{"ticker": "FXAIX", "amount": 1}])
+    app.result_cache[with_voo] = ({}, {})
+    app.result_cache[without_voo] = ({}, {})
+    app.invalidate_results(("etf", "VOO"))
+    assert list(app.result_cache) == [without_voo]
+
+
+def test_changed_holdings_invalidate_cached_results(monkeypatch):
+    holdings = {"AAPL": 7.0, "MSFT": 6.0}
+    monkeypatch.setattr(app, "get_etf_holdings_from_stock_analysis", lambda ticker: dict(holdings))
+    monkeypatch.setattr(app, "HOLDINGS_TTL", 0)  # every call re-fetches
+
+    _, version = app.get_holdings_snapshot("etf", "VOO")
+    key = fingerprint([{"ticker": "VOO", "amount": 1}], versions={("etf", "VOO"): version})
+    app.result_cache[key] = ({}, {})
+
+    # Same holdings on re-fetch: same version, cached result stays
+    assert app.get_holdings_snapshot("etf", "VOO")[1] == version
+    assert key in app.result_cache
+
+    holdings["AAPL"] = 8.0
+    _, new_version = app.get_holdings_snapshot("etf", "VOO")
+    assert new_version != version
+    assert key not in app.result_cache
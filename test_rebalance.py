@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from rebalance import holdings_matrix, sector_matrix, find_rebalance, linprog
+
+
+def random_funds(rng, n_funds, n_stocks=60):
+    funds = []
+    for _ in range(n_funds):
+        held = rng.choice(n_stocks, size=20, replace=False)
+        weights = rng.pareto(1.2, size=20) + 0.01
+        funds.append({f"S{i}": 100 * w / weights.sum() for i, w in zip(held, weights)})
+    return funds
+
+
+def turnover(weights, w0):
+    return np.abs(weights - w0).sum() / 2
+
+
+def test_linprog_small_problem():
+    # min -x0 - x1 subject to x0 + 2 x1 + s = 4, x0 + s2 = 3
+    A = np.array([[1.0, 2.0, 1.0, 0.0], [1.0, 0.0, 0.0, 1.0]])
+    x = linprog(np.array([-1.0, -1.0, 0.0, 0.0]), A, np.array([4.0, 3.0]))
+    np.testing.assert_allclose(x[:2], [3.0, 0.5])
+
+
+def test_linprog_infeasible():
+    # x0 + x1 = 1 and x0 + x1 = 2 cannot both hold
+    assert linprog(np.zeros(2), np.array([[1.0, 1.0], [1.0, 1.0]]), np.array([1.0, 2.0])) is None
+
+
+def test_rebalance_sums_to_one_meets_caps_and_is_optimal():
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        n_funds = rng.integers(2, 5)
+        stocks, H = holdings_matrix(random_funds(rng, n_funds))
+        w0 = rng.dirichlet(np.ones(n_funds))
+        samples = np.vstack([np.eye(n_funds), rng.dirichlet(np.ones(n_funds), 2000)])
+        feasible = samples[(samples @ H.T).max(axis=1) <= np.quantile((samples @ H.T).max(axis=1), 0.3)]
+        cap = float((feasible @ H.T).max())  # at least 30% of the samples meet this cap
+
+        weights = find_rebalance(H, w0, cap)
+        assert weights is not None
+        assert np.all(weights >= 0)
+        assert abs(weights.sum() - 1) < 1e-9
+        assert (H @ weights).max() <= cap + 1e-6
+        # No sampled feasible allocation is closer to the current one
+        assert turnover(weights, w0) <= np.abs(feasible - w0).sum(axis=1).min() / 2 + 1e-9
+
+
+def test_rebalance_individual_stock_cap():
+    # 1/3 each in two funds and AAPL itself: AAPL is 37% of the portfolio
+    stocks, H = holdings_matrix([{"AAPL": 7.0, "MSFT": 6.0}, {"AAPL": 4.0, "AMZN": 3.0}, {"AAPL": 100.0}])
+    weights = find_rebalance(H, [1, 1, 1], 20.0)
+    assert abs(weights.sum() - 1) < 1e-9
+    assert (H @ weights).max() <= 20 + 1e-6
+    # Cheapest fix moves 17/96 of the portfolio out of AAPL into the second fund
+    assert abs(turnover(weights, 1 / 3) - 17 / 96) < 1e-9
+
+
+@pytest.mark.parametrize("n_funds", [9, 10, 12])
+def test_rebalance_feasible_only_as_a_mix(n_funds):
+    # Each fund is 50% in its own stock, so with a 6% cap no fund may exceed 0.12:
+    # no single fund meets the cap, but spreading across all of them does
+    funds = [{f"S{j}": 50.0, f"T{j}": 50.0} for j in range(n_funds)]
+    stocks, H = holdings_matrix(funds)
+    w0 = np.zeros(n_funds)
+    w0[0] = 1.0
+    weights = find_rebalance(H, w0, 6.0)
+    assert weights is not None
+    assert abs(weights.sum() - 1) < 1e-9
+    assert (H @ weights).max() <= 6 + 1e-6
+
+
+@pytest.mark.parametrize("n_funds, sector_cap", [(6, 20.0), (11, 12.0)])
+def test_rebalance_sector_cap_feasible_only_as_a_mix(n_funds, sector_cap):
+    funds = [{f"S{j}_{k}": 10.0 for k in range(10)} for j in range(n_funds)]
+    stocks, H = holdings_matrix(funds)
+    _, S = sector_matrix(stocks, {stock: stock.split("_")[0] for stock in stocks})
+    w0 = np.full(n_funds, 0.5 / (n_funds - 1))
+    w0[0] = 0.5
+    weights = find_rebalance(H, w0, 100.0, S, sector_cap)
+    assert weights is not None
+    assert abs(weights.sum() - 1) < 1e-9
+    assert (S @ H @ weights).max() <= sector_cap + 1e-6
+
+
+def test_rebalance_infeasible_returns_none():
+    stocks, H = holdings_matrix([{"AAPL": 50.0, "MSFT": 50.0}])
+    assert find_rebalance(H, [1.0], 5.0) is None
+    # Two funds both 50% in AAPL can never get under 10%
+    stocks, H = holdings_matrix([{"AAPL": 50.0, "MSFT": 50.0}, {"AAPL": 50.0, "AMZN": 50.0}])
+    assert find_rebalance(H, [1, 1], 10.0) is None